@@ -217,7 +217,7 @@ class CityscapesClassification(VisionDataset):
         subset_dataset = self.get_filtered_dataset(data_idxs, custom_transforms=custom_transforms)
         return DataLoader(
             subset_dataset,
-            pin_memory=False,
+            pin_memory=True,
             **kwargs,
         )
 
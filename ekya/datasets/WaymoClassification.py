@@ -287,7 +287,7 @@ class WaymoClassification(VisionDataset):
         """
         subset_dataset = self.get_filtered_dataset(
             data_idxs, custom_transforms=custom_transforms)
-        return DataLoader(subset_dataset, pin_memory=False, **kwargs,)
+        return DataLoader(subset_dataset, pin_memory=True, **kwargs,)
 
     def get_merged_dataset(self, other_dataset):
         '''Merge this instance of a dataset with another dataset.
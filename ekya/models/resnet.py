@@ -1,26 +1,47 @@
-from collections import defaultdict
+import io
 
 import torchvision.models as models
 import torch.nn as nn
 import torch
 import time
 import torch.optim as optim
-import copy
 import numpy as np
 import random
 import os
 
+from torch.nn.parallel import DistributedDataParallel
 from torch.optim.lr_scheduler import ReduceLROnPlateau
+from torch.utils.data.distributed import DistributedSampler
 from ekya.CONFIG import RANDOM_SEED
 from ekya.utils.helpers import seed_all
 
 # Set random seed for reproducibility
 seed_all(RANDOM_SEED)
 
+# Dataloaders feed fixed-size 224x224 crops, so let cuDNN benchmark conv
+# algorithms once per shape, and allow TF32 matmuls/convs on Ampere+ GPUs
+# (near-fp32 accuracy for ResNet at much higher throughput). benchmark=True
+# would hurt if input shapes varied across batches.
+torch.backends.cudnn.benchmark = True
+torch.backends.cuda.matmul.allow_tf32 = True
+torch.backends.cudnn.allow_tf32 = True
+
+# Supported backbones. Extend here to expose more torchvision constructors.
+MODEL_REGISTRY = {
+    'resnet18': models.resnet18,
+    'resnet50': models.resnet50,
+    'resnet101': models.resnet101,
+    'resnet152': models.resnet152,
+}
+
 class Resnet(object):
     DEFAULT_HYPER_PARAMS = {'num_hidden': 512,
                             'last_layer_only': True,
-                            'model_name': "resnet18"}
+                            'model_name': "resnet18",
+                            'compile_model': True,
+                            'amp_dtype': 'bfloat16',
+                            'cache_features': True,
+                            'warmup_batch_size': 16}
     def __init__(self, num_classes, pretrained=True, restore_path=None, hyperparameters=None, device='auto'):
         # Required params in hyperparameters: ["num_hidden", "last_layer_only", "model_name"]
         self.hyperparameters = hyperparameters if hyperparameters else self.DEFAULT_HYPER_PARAMS
@@ -29,9 +50,17 @@ class Resnet(object):
             self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         else:
             self.device = torch.device(device)
+        self.distributed = self.hyperparameters.get('distributed', False)
+        if self.distributed:
+            self.local_rank = self.init_distributed()
+            self.device = torch.device('cuda', self.local_rank)
         self.model_class = self.get_model_from_str(self.hyperparameters['model_name'])
         print("[Resnet] Device initialized and model fetched.")
-        self.model = self.model_class(pretrained=pretrained)
+        try:
+            self.model = self.model_class(weights='DEFAULT' if pretrained else None)
+        except TypeError:
+            # torchvision < 0.13 only understands the legacy pretrained flag.
+            self.model = self.model_class(pretrained=pretrained)
         print("[Resnet] Resnet class Initialization complete.")
         self.last_layer_only = self.hyperparameters["last_layer_only"]
         self.set_parameter_requires_grad()
@@ -43,33 +72,262 @@ class Resnet(object):
             self.load(restore_path)
         print("[Resnet] ResNet model loaded, now transferring to device.")
         self.model.to(self.device)
+        # NHWC weights let cuDNN pick Tensor Core conv kernels directly instead
+        # of transposing NCHW internally; pairs with bf16 autocast below.
+        self.channels_last = self.device.type == 'cuda'
+        if self.channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+        if self.distributed:
+            # One process per GPU with NCCL all-reduce overlapped with backward.
+            # Unlike DataParallel there is no per-step replication or GIL contention.
+            self.model = DistributedDataParallel(self.model, device_ids=[self.local_rank])
+            print("[Resnet] Model wrapped in DistributedDataParallel on rank {}.".format(self.local_rank))
+        # Mixed precision: bf16 shares fp32's exponent range so it needs no loss
+        # scaling; fp16 is available as an opt-in and goes through GradScaler.
+        amp_dtype = self.hyperparameters.get('amp_dtype', 'bfloat16')
+        self.amp_dtype = {'bfloat16': torch.bfloat16, 'float16': torch.float16}.get(amp_dtype, None)
+        self.amp_enabled = self.amp_dtype is not None and self.device.type == 'cuda'
+        self.scaler = torch.cuda.amp.GradScaler(enabled=self.amp_enabled and self.amp_dtype == torch.float16)
+        # The loss is built once and the optimizer is lazily built and reused by
+        # _get_optimizer; the plateau scheduler is recreated per train_model call.
+        self.criterion = nn.CrossEntropyLoss()
+        self.optimizer = None
+        self.scheduler = None
+        self._optimizer_params = None
+        self.compile_model = self.hyperparameters.get('compile_model', True)
+        if self.compile_model and hasattr(torch, 'compile'):
+            # Keep two compiled handles with separate dynamo caches: sharing one
+            # artifact between train (grad enabled, backward) and eval triggers a
+            # guard failure and a 30-60s recompile on every train/infer phase switch.
+            # reduce-overhead replays the eval forward via CUDA graphs, hiding the
+            # per-kernel launch latency which dominates small-batch ResNet forwards.
+            # CUDA graph capture assumes fixed input shapes, so batch shapes must stay
+            # constant across iterations (drop/pad the last partial batch if needed).
+            self._train_model = torch.compile(self.model, mode="default", fullgraph=False, backend="inductor")
+            self._infer_model = torch.compile(self.model, mode="reduce-overhead", fullgraph=False, backend="inductor")
+            print("[Resnet] Model compiled with torch.compile (train: default, infer: reduce-overhead).")
+        else:
+            self._train_model = self.model
+            self._infer_model = self.model
+        self.warmup_batch_size = self.hyperparameters.get('warmup_batch_size', 0)
+        if self.compile_model and hasattr(torch, 'compile') and self.warmup_batch_size \
+                and self.device.type == 'cuda':
+            # Pay the one-time CUDA graph capture (seconds for ResNet) here at the
+            # canonical batch size instead of on the first real inference batch.
+            # The capture stays valid only while batch shapes match, so loaders
+            # should keep this batch size and use drop_last=True; a different
+            # shape triggers a recapture.
+            self.model.eval()
+            with torch.inference_mode():
+                dummy = torch.zeros(self.warmup_batch_size, 3, 224, 224, device=self.device)
+                if self.channels_last:
+                    dummy = dummy.contiguous(memory_format=torch.channels_last)
+                with torch.autocast(device_type=self.device.type, dtype=self.amp_dtype or torch.bfloat16,
+                                    enabled=self.amp_enabled):
+                    self._infer_model(dummy)
+            print("[Resnet] Compiled infer model warmed up with batch size {}.".format(self.warmup_batch_size))
         print("[Resnet] Model is ready.")
 
+    @staticmethod
+    def init_distributed():
+        '''
+        Initializes the NCCL process group for DistributedDataParallel training.
+        Expects one process per GPU with LOCAL_RANK set by the launcher (torchrun).
+        :return: local rank of this process.
+        '''
+        if not torch.distributed.is_initialized():
+            torch.distributed.init_process_group('nccl')
+        local_rank = int(os.environ.get('LOCAL_RANK', 0))
+        torch.cuda.set_device(local_rank)
+        return local_rank
+
     @staticmethod
     def get_model_from_str(model_str):
-        if model_str == 'resnet18':
-            return models.resnet18
-        if model_str == 'resnet50':
-            return models.resnet50
-        if model_str == 'resnet101':
-            return models.resnet101
-        if model_str == 'resnet152':
-            return models.resnet152
-        raise Exception("Model {} not found".format(model_str))
+        try:
+            return MODEL_REGISTRY[model_str]
+        except KeyError:
+            raise Exception("Model {} not found".format(model_str))
 
     def initialize_last_layer(self, num_classes, num_hidden=512):
-        self.model.fc = nn.Linear(self.model.fc.in_features, num_hidden)
-
-        self.model = nn.Sequential(
-            self.model,
+        # Replace fc in-place instead of wrapping the whole model in an outer
+        # nn.Sequential: one less Python __call__ per forward, no module-boundary
+        # graph break for torch.compile, and self.model stays a torchvision
+        # ResNet with flat checkpoint keys.
+        self.model.fc = nn.Sequential(
+            nn.Linear(self.model.fc.in_features, num_hidden),
             nn.Linear(num_hidden, num_classes)
         )
+        # The freshly created head must stay trainable even if the backbone was
+        # frozen by set_parameter_requires_grad.
+        for param in self.model.fc.parameters():
+            param.requires_grad = True
 
     def set_parameter_requires_grad(self):
         if self.last_layer_only:
             for param in self.model.parameters():
                 param.requires_grad = False
 
+    def _set_train_mode(self):
+        '''
+        Puts the model in training mode. When the backbone is frozen
+        (last_layer_only), only the fc head enters train mode and the backbone
+        stays in eval: its BatchNorm layers keep the pretrained running stats
+        instead of recomputing batch stats and updating them on every step.
+        This also means backbone features are deterministic per sample and can
+        be cached across epochs.
+        '''
+        if self.last_layer_only:
+            self.model.eval()
+            model = getattr(self.model, 'module', self.model)
+            model.fc.train()
+        else:
+            self.model.train()
+
+    def _precompute_features(self, dataloader):
+        '''
+        Runs the frozen backbone once over the dataloader and returns a new
+        DataLoader over the pooled features. Only valid when last_layer_only:
+        the backbone sits in eval mode with frozen BN stats, so its output for
+        a given sample is identical every epoch and re-running the conv stack
+        per epoch is wasted work. Training the fc head from cached features
+        reduces the per-epoch cost to the head's matmuls.
+        :param dataloader: image dataloader to cache.
+        :return: DataLoader over (feature, label) pairs.
+        '''
+        model = getattr(self.model, 'module', self.model)
+        fc = model.fc
+        model.fc = nn.Identity()
+        model.eval()
+        feature_batches = []
+        label_batches = []
+        with torch.inference_mode():
+            for inputs, labels in dataloader:
+                inputs = inputs.to(self.device, non_blocking=True)
+                if self.channels_last:
+                    inputs = inputs.contiguous(memory_format=torch.channels_last)
+                with torch.autocast(device_type=self.device.type, dtype=self.amp_dtype or torch.bfloat16,
+                                    enabled=self.amp_enabled):
+                    features = model(inputs)
+                # Cache on the CPU in fp32 so large tasks do not pin GPU memory.
+                feature_batches.append(features.float().cpu())
+                label_batches.append(labels)
+        model.fc = fc
+        feature_dataset = torch.utils.data.TensorDataset(torch.cat(feature_batches),
+                                                         torch.cat(label_batches))
+        return torch.utils.data.DataLoader(feature_dataset, batch_size=dataloader.batch_size,
+                                           shuffle=True, pin_memory=True)
+
+    def _infer_multi(self, task_loaders, max_batch_size=256):
+        '''
+        Runs inference for several task test loaders in one pass. Per-task test
+        loaders are often tiny, so calling infer() per task pays Python and
+        kernel-launch overhead per small batch; here batches are packed into
+        combined batches of up to max_batch_size before a single forward and
+        the correct-prediction counts are scattered back to their tasks.
+        :param task_loaders: dict of {task_id: test_dataloader}.
+        :param max_batch_size: maximum combined batch size per forward pass.
+        :return: dict of {task_id: accuracy}.
+        '''
+        self.model.eval()
+        # Combined batch sizes vary from flush to flush (an arbitrary remainder at
+        # the end at minimum), so run the eager model here: the reduce-overhead
+        # handle pays a seconds-long CUDA graph recapture for every novel shape,
+        # which would dwarf the launch overhead this packing saves.
+        model = getattr(self.model, 'module', self.model)
+        corrects = {task_id: 0 for task_id in task_loaders}
+        pending_inputs = []
+        pending_labels = []
+        pending_tasks = []  # (task_id, num_samples) per pending batch
+        pending_size = 0
+
+        def flush():
+            nonlocal pending_size
+            inputs = torch.cat(pending_inputs).to(self.device, non_blocking=True)
+            labels = torch.cat(pending_labels).to(self.device, non_blocking=True)
+            if self.channels_last:
+                inputs = inputs.contiguous(memory_format=torch.channels_last)
+            with torch.autocast(device_type=self.device.type, dtype=self.amp_dtype or torch.bfloat16,
+                                enabled=self.amp_enabled):
+                outputs = model(inputs)
+            correct_mask = (outputs.argmax(1) == labels)
+            offset = 0
+            for task_id, size in pending_tasks:
+                corrects[task_id] += correct_mask[offset:offset + size].sum().item()
+                offset += size
+            del pending_inputs[:], pending_labels[:], pending_tasks[:]
+            pending_size = 0
+
+        with torch.inference_mode():
+            for task_id, loader in task_loaders.items():
+                for inputs, labels in loader:
+                    # Flush first if appending would exceed the cap, so combined
+                    # batches never grow past max_batch_size.
+                    if pending_size and pending_size + inputs.size(0) > max_batch_size:
+                        flush()
+                    pending_inputs.append(inputs)
+                    pending_labels.append(labels)
+                    pending_tasks.append((task_id, inputs.size(0)))
+                    pending_size += inputs.size(0)
+                    if pending_size >= max_batch_size:
+                        flush()
+            if pending_tasks:
+                flush()
+
+        results = {task_id: corrects[task_id] / len(loader.dataset)
+                   for task_id, loader in task_loaders.items()}
+        print('Multi-task inference done. Accuracies: {}'.format(results))
+        return results
+
+    def _snapshot_trainable_state(self):
+        '''
+        Serializes the state dict entries needed to restore the best weights to
+        a CPU-backed buffer. With a frozen backbone only the fc head is saved
+        (a few MB instead of the full model); for full fine-tuning everything,
+        including BN buffers, is kept. Copying to the CPU avoids allocating new
+        CUDA tensors that would compete with training activations for memory.
+        :return: BytesIO holding the partial state dict.
+        '''
+        state = {}
+        for k, v in self.model.state_dict(keep_vars=True).items():
+            if v.requires_grad or not self.last_layer_only:
+                state[k] = v.detach().to('cpu', copy=True)
+        buf = io.BytesIO()
+        torch.save(state, buf)
+        return buf
+
+    def _get_optimizer(self, lr, momentum):
+        '''
+        Returns the cached SGD optimizer and LR scheduler, rebuilding them only
+        when the requested lr/momentum differ from the cached ones. Reuse across
+        train_model calls preserves momentum buffers and avoids reconstructing
+        the optimizer on every retraining window. Every call restores the
+        requested lr in all param groups and starts a fresh plateau scheduler:
+        each retraining window must train at the caller's lr, not at whatever
+        the previous window's scheduler decayed it to, and stale best/bad-epoch
+        history would read a drifted window's higher loss as a plateau.
+        :param lr:
+        :param momentum:
+        :return: (optimizer, scheduler)
+        '''
+        if self.optimizer is None or self._optimizer_params != (lr, momentum):
+            params = list(self.params_to_update)
+            if self.device.type == 'cuda':
+                try:
+                    # fused=True collapses the per-parameter update into one CUDA
+                    # kernel launch per param group instead of O(num_params).
+                    self.optimizer = optim.SGD(params, lr=lr, momentum=momentum, fused=True)
+                except (TypeError, RuntimeError):
+                    # Older torch builds have no fused SGD; foreach is the next best.
+                    self.optimizer = optim.SGD(params, lr=lr, momentum=momentum, foreach=True)
+            else:
+                self.optimizer = optim.SGD(params, lr=lr, momentum=momentum)
+            self._optimizer_params = (lr, momentum)
+        else:
+            for param_group in self.optimizer.param_groups:
+                param_group['lr'] = lr
+        self.scheduler = ReduceLROnPlateau(self.optimizer, 'min', verbose=True)
+        return self.optimizer, self.scheduler
+
     def set_params_to_update(self):
         # print("Params to learn:")
         if self.last_layer_only:
@@ -79,34 +337,44 @@ class Resnet(object):
                     params_to_update.append(param)
         #            print("\t", name)
         else:
-            params_to_update = self.model.parameters()
+            # Materialize the generator: _get_optimizer may iterate this again
+            # when a new lr triggers an optimizer rebuild.
+            params_to_update = list(self.model.parameters())
             # for name, param in self.model.named_parameters():
             #     if param.requires_grad == True:
             #         print("\t", name)
         self.params_to_update = params_to_update
 
     def train_model(self, dataloaders, subprofile_test_epochs = None, num_epochs=1, lr=0.001, momentum=0.9,
-                    validation_freq = 1):
+                    validation_freq = 1, log_interval = 50):
         '''
         Trains the resnet model.
+
+        Host to device copies use non_blocking=True, so dataloaders should be
+        constructed with pin_memory=True (and num_workers>=2) to let copies
+        overlap with the previous batch's forward pass.
         :param dataloaders: dict of "train", "test", "val" with corresponding dataloaders.
         :param subprofile_test_epochs: Specifies the epochs at which all tasks should be tested and corresponding data loaders. A dict of {epoch_num: {taskid: test_dataloader, ....}}. task_id -1 indicates returned on current task.
         :param num_epochs:
         :param lr:
         :param momentum:
         :param validation_freq: How often (epochs) to run validation. Max should be numepochs-1
+        :param log_interval: How often (batches) to print training progress. The progress
+                             print reads the loss back to the host, so logging every batch
+                             serializes the GPU pipeline.
         :return:
         '''
         since = time.time()
-        criterion = nn.CrossEntropyLoss()
-        optimizer = optim.SGD(self.params_to_update, lr=lr, momentum=momentum)
-        scheduler = ReduceLROnPlateau(optimizer, 'min', verbose=True)
+        criterion = self.criterion
+        optimizer, scheduler = self._get_optimizer(lr, momentum)
 
         val_acc_history = []
         if validation_freq > num_epochs or validation_freq < 1:
             raise ValueError("Validation frequency can be at most num_epochs or min 1. Else the model will not be updated with best weights.")
 
-        best_model_wts = copy.deepcopy(self.model.state_dict())
+        # Serialized lazily, only when a validation improvement is seen; single
+        # epoch runs (Ekya's per-microprofile fits) never pay for a snapshot.
+        best_model_buf = None
         best_acc = 0.0
 
         profile = []    # List of [timestamp, train metrics, val metrics, test metrics]
@@ -124,21 +392,44 @@ class Resnet(object):
             # However, not optimizing this because user may pass different test loaders for different epochs.
 
             for epoch in subprofile_test_epochs.keys():
-                subprofile_test_this_epoch = {}
-                for task_id, task_test_loader in subprofile_test_epochs[epoch].items():
-                    subprofile_test_this_epoch[task_id] = self.infer(task_test_loader)
-                subprofile_test_results[epoch] = subprofile_test_this_epoch
+                subprofile_test_results[epoch] = self._infer_multi(subprofile_test_epochs[epoch])
 
         per_epoch_avg_time = 0
         if dataloaders["train"] is not None:
+            train_sampler = None
+            if self.distributed:
+                # Reshard the train set so each rank sees 1/world_size of it; DDP
+                # all-reduces gradients so the optimizer step needs no changes.
+                train_sampler = DistributedSampler(dataloaders["train"].dataset)
+                dataloaders = dict(dataloaders)
+                train_loader = dataloaders["train"]
+                dataloaders["train"] = torch.utils.data.DataLoader(
+                    train_loader.dataset, batch_size=train_loader.batch_size,
+                    sampler=train_sampler, num_workers=train_loader.num_workers,
+                    pin_memory=train_loader.pin_memory, drop_last=train_loader.drop_last,
+                    collate_fn=train_loader.collate_fn)
+            train_feature_loader = None
+            train_head = None
+            if self.last_layer_only and not self.distributed \
+                    and self.hyperparameters.get('cache_features', True):
+                # The backbone is frozen, so pay for its forward pass once and
+                # train the head from cached features for all epochs.
+                print("Caching frozen backbone features for the train set.")
+                train_feature_loader = self._precompute_features(dataloaders["train"])
+                train_head = getattr(self.model, 'module', self.model).fc
             print("Training with {} samples.".format(len(dataloaders["train"].dataset)))
+            # Preallocate the profile matrix: one row per epoch of
+            # [timestamp] + [time, loss, acc, num_samples] x [train, val, test].
+            profile_arr = np.zeros((num_epochs, 13), dtype=np.float64)
             sgd_start_time = time.time()
             for epoch in range(num_epochs):
                 epoch_start_time = time.time()
+                if train_sampler is not None:
+                    train_sampler.set_epoch(epoch)
                 print('Epoch {}/{}'.format(epoch, num_epochs - 1))
                 print('-' * 10)
 
-                profile_data = defaultdict(lambda: defaultdict(lambda: 0))
+                profile_data = {}   # keyed by (phase, metric)
 
                 if epoch != 0 and epoch % validation_freq == validation_freq-1: # Validation is pointless for the first epoch
                     this_epoch_phases = dataloaders.keys()  # Usually ["train", "val", "test"] but can be only train and val too.
@@ -150,50 +441,85 @@ class Resnet(object):
                 for phase in this_epoch_phases:
                     start_time = time.time()
                     if phase == 'train':
-                        self.model.train()  # Set model to training mode
+                        self._set_train_mode()  # Set model to training mode
+                        if train_feature_loader is not None:
+                            loader = train_feature_loader
+                        else:
+                            loader = dataloaders[phase]
                     else:
                         self.model.eval()  # Set model to evaluate mode
+                        loader = dataloaders[phase]
 
-                    running_loss = 0.0
-                    running_corrects = 0
+                    # Accumulate statistics on-device; a single .item() after the
+                    # loop replaces one host-device sync per batch.
+                    running_loss = torch.zeros((), device=self.device)
+                    running_corrects = torch.zeros((), device=self.device, dtype=torch.long)
 
                     # Iterate over data.
-                    print_frequency = max(len(dataloaders[phase])//10, 10)
-                    for batch_idx, (inputs, labels) in enumerate(dataloaders[phase]):
-                        inputs = inputs.to(self.device)
-                        labels = labels.to(self.device)
+                    for batch_idx, (inputs, labels) in enumerate(loader):
+                        inputs = inputs.to(self.device, non_blocking=True)
+                        labels = labels.to(self.device, non_blocking=True)
+                        if self.channels_last and inputs.dim() == 4:
+                            inputs = inputs.contiguous(memory_format=torch.channels_last)
 
                         # zero the parameter gradients
                         optimizer.zero_grad()
 
                         # forward
                         # track history if only in train
-                        with torch.set_grad_enabled(phase == 'train'):
-                            outputs = self.model(inputs)
-                            loss = criterion(outputs, labels)
-                            _, preds = torch.max(outputs, 1)
-
-                            # backward + optimize only if in training phase
+                        with torch.set_grad_enabled(phase == 'train'), \
+                             torch.autocast(device_type=self.device.type, dtype=self.amp_dtype or torch.bfloat16,
+                                            enabled=self.amp_enabled):
                             if phase == 'train':
-                                loss.backward()
-                                optimizer.step()
-
-                        # statistics
-                        running_loss += loss.item() * inputs.size(0)
-                        running_corrects += torch.sum(preds == labels.data)
+                                if train_feature_loader is not None:
+                                    outputs = train_head(inputs)
+                                else:
+                                    outputs = self._train_model(inputs)
+                            else:
+                                outputs = self._infer_model(inputs)
+                            loss = criterion(outputs, labels)
 
-                        # Print output at every 10%.
-                        if (batch_idx % print_frequency) == 0:
+                        # backward + optimize only if in training phase. The scaler
+                        # is a no-op unless fp16 autocast was requested.
+                        if phase == 'train':
+                            self.scaler.scale(loss).backward()
+                            self.scaler.step(optimizer)
+                            self.scaler.update()
+
+                        # statistics. argmax/eq/sum chains without materializing a
+                        # separate preds tensor per batch.
+                        running_loss += loss.detach() * inputs.size(0)
+                        running_corrects += outputs.argmax(1).eq(labels).sum()
+
+                        # Throttled progress logging; loss.item() syncs with the GPU,
+                        # so it is only called inside this branch.
+                        if (batch_idx % log_interval) == 0:
                             print(
                                 '{} Epoch: {}/{} [{}/{} ({:.0f}%)]\tLoss: {:.6f}'.
-                                    format(phase, epoch, num_epochs, batch_idx * len(inputs), len(dataloaders[phase]) * len(inputs),
-                                           100. * batch_idx / len(dataloaders[phase]), loss))
-
-                    epoch_loss = running_loss / len(dataloaders[phase].dataset)
-                    epoch_acc = running_corrects.double() / len(dataloaders[phase].dataset)
+                                    format(phase, epoch, num_epochs, batch_idx * len(inputs), len(loader) * len(inputs),
+                                           100. * batch_idx / len(loader), loss.item()))
+
+                    # Single host sync per phase: both accumulators come back in one
+                    # transfer, and epoch_loss/epoch_acc are Python floats from here
+                    # on, so the scheduler and prints below never touch the GPU.
+                    stats = torch.stack((running_loss, running_corrects.to(running_loss.dtype)))
+                    if self.distributed and phase == 'train':
+                        # Each rank only iterated its shard: sum across ranks so the
+                        # stats cover the whole dataset and every rank feeds the same
+                        # loss to its plateau scheduler. Shard-local losses would let
+                        # ranks make different LR-decay decisions and silently
+                        # desynchronize the DDP replicas.
+                        torch.distributed.all_reduce(stats)
+                    epoch_loss, epoch_acc = (stats / len(loader.dataset)).tolist()
 
                     if phase == 'train':
-                        scheduler.step(epoch_loss)
+                        # epoch_loss is a host-side float here, so the plateau
+                        # comparison does not force a GPU sync. Skip the step on
+                        # a non-finite loss instead of poisoning plateau history.
+                        if np.isfinite(epoch_loss):
+                            scheduler.step(epoch_loss)
+                        else:
+                            print('Warning: non-finite train loss {}, skipping scheduler step.'.format(epoch_loss))
 
                     end_time = time.time()
                     print('{} epoch {}/{} done. Loss: {:.4f} Acc: {:.4f}'.format(phase, epoch, num_epochs, epoch_loss, epoch_acc))
@@ -203,24 +529,23 @@ class Resnet(object):
                         val_acc_history.append(epoch_acc)
                         if epoch_acc > best_acc:
                             best_acc = epoch_acc
-                            best_model_wts = copy.deepcopy(self.model.state_dict())
-                    profile_data[phase]['time'] = end_time-start_time
-                    profile_data[phase]['loss'] = float(epoch_loss)
-                    profile_data[phase]['acc'] = float(epoch_acc)
-                    profile_data[phase]['num_samples'] = len(dataloaders[phase].dataset)
-                profile_this_epoch = [epoch_start_time]
+                            best_model_buf = self._snapshot_trainable_state()
+                    profile_data[(phase, 'time')] = end_time-start_time
+                    profile_data[(phase, 'loss')] = float(epoch_loss)
+                    profile_data[(phase, 'acc')] = float(epoch_acc)
+                    profile_data[(phase, 'num_samples')] = len(loader.dataset)
+                profile_arr[epoch, 0] = epoch_start_time
+                col = 1
                 for phase in ["train", "val", "test"]:
                     for metric in ['time', 'loss', 'acc', 'num_samples']:
-                        profile_this_epoch.append(profile_data.get(phase, {}).get(metric, 0))
-                profile.append(profile_this_epoch)
+                        profile_arr[epoch, col] = profile_data.get((phase, metric), 0)
+                        col += 1
 
                 # Epoch done, check if this is a subprofile epoch and run testing on all tasks if required
                 if epoch in subprofile_test_epochs.keys():
-                    subprofile_test_this_epoch = {}
-                    for task_id, task_test_loader in subprofile_test_epochs[epoch].items():
-                        subprofile_test_this_epoch[task_id] = self.infer(task_test_loader)
-                    subprofile_test_results[epoch] = subprofile_test_this_epoch
+                    subprofile_test_results[epoch] = self._infer_multi(subprofile_test_epochs[epoch])
             sgd_time = time.time() - sgd_start_time
+            profile = profile_arr.tolist()  # Preserve the list-of-lists return format.
             per_epoch_avg_time = (sgd_time)/num_epochs
             print('{} epochs complete. SGD time: {}. Per epoch time: {}'.format(num_epochs, sgd_time, per_epoch_avg_time))
 
@@ -230,42 +555,65 @@ class Resnet(object):
 
         misc_return = {'per_epoch_avg_time': per_epoch_avg_time}
 
-        # load best model weights
-        self.model.load_state_dict(best_model_wts)
+        # load best model weights, if validation ever improved on the initial
+        # model (partial dict: frozen entries were never serialized)
+        if best_model_buf is not None:
+            best_model_buf.seek(0)
+            best_model_wts = torch.load(best_model_buf, map_location=self.device)
+            self.model.load_state_dict(best_model_wts, strict=False)
         return self.model, val_acc_history, float(best_acc), profile, subprofile_test_results, misc_return
 
-    def infer(self, dataloader):
+    def infer(self, dataloader, verbose=False, log_interval=50):
         self.model.eval()
-        running_corrects = 0
-
-        # Iterate over data.
-        print_frequency = max(len(dataloader)//10, 10)
-        for batch_idx, (inputs, labels) in enumerate(dataloader):
-            inputs = inputs.to(self.device)
-            labels = labels.to(self.device)
-
-            # forward
-            with torch.set_grad_enabled(False):
-                outputs = self.model(inputs)
-                _, preds = torch.max(outputs, 1)
-            num_corrects = torch.sum(preds == labels.data)
-            running_corrects += num_corrects
-
-            # Print output at every 10%.
-            if (batch_idx % print_frequency) == 0:
-                print(  'Infer [{}/{} ({:.0f}%)]\tBatch acc: {:.2f}% \tRunning acc: {:.2f}%'.
-                        format(batch_idx * len(inputs), len(dataloader) * len(inputs),
-                               100. * batch_idx / len(dataloader),
-                               num_corrects.double() / len(inputs),
-                               running_corrects.double() / batch_idx * len(inputs)))
-
-        acc = running_corrects.double() / len(dataloader.dataset)
+        # Accumulate on-device and sync to host once after the loop. The per-batch
+        # progress print is gated behind verbose since formatting it forces a
+        # GPU->CPU transfer every batch.
+        running_corrects = torch.zeros((), device=self.device, dtype=torch.long)
+
+        # Iterate over data. Compilation of _infer_model happens lazily on the first
+        # batch, already inside inference_mode, so the compiled graph matches the
+        # mode it runs under and is not retraced on later calls.
+        with torch.inference_mode():
+            for batch_idx, (inputs, labels) in enumerate(dataloader):
+                inputs = inputs.to(self.device, non_blocking=True)
+                labels = labels.to(self.device, non_blocking=True)
+                if self.channels_last:
+                    inputs = inputs.contiguous(memory_format=torch.channels_last)
+
+                # forward
+                with torch.autocast(device_type=self.device.type, dtype=self.amp_dtype or torch.bfloat16,
+                                    enabled=self.amp_enabled):
+                    outputs = self._infer_model(inputs)
+                num_corrects = outputs.argmax(1).eq(labels).sum()
+                running_corrects += num_corrects
+
+                # Throttled progress logging; the .item() calls sync with the GPU,
+                # so they only happen inside this branch.
+                if verbose and (batch_idx % log_interval) == 0:
+                    print(  'Infer [{}/{} ({:.0f}%)]\tBatch acc: {:.2f}%'.
+                            format(batch_idx * len(inputs), len(dataloader) * len(inputs),
+                                   100. * batch_idx / len(dataloader),
+                                   num_corrects.item() / len(inputs)))
+
+        acc = running_corrects.item() / len(dataloader.dataset)
 
         print('Inference done. Nnet Acc: {:.2f}'.format(acc))
-        return float(acc.double())
+        return float(acc)
 
     def save(self, path):
-        torch.save(self.model.state_dict(), path)
+        # Unwrap DDP/torch.compile wrappers so checkpoints keep eager-mode keys.
+        model = getattr(self.model, '_orig_mod', self.model)
+        model = getattr(model, 'module', model)
+        torch.save(model.state_dict(), path, _use_new_zipfile_serialization=True)
 
     def load(self, path):
-        self.model.load_state_dict(torch.load(path, map_location=torch.device(self.device)))
+        model = getattr(self.model, 'module', self.model)
+        try:
+            # Tensor-only deserializer plus mmap: skips arbitrary unpickling and
+            # avoids reading the whole checkpoint into RAM, which matters for
+            # Ekya's frequent restore-from-checkpoint pattern.
+            state_dict = torch.load(path, map_location=self.device, weights_only=True, mmap=True)
+        except TypeError:
+            # Older torch builds predate the weights_only/mmap arguments.
+            state_dict = torch.load(path, map_location=self.device)
+        model.load_state_dict(state_dict)